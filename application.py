@@ -1,6 +1,8 @@
 import os
 
-from portal import app as application
+from portal import create_app
+
+application = create_app()
 
 if __name__ == '__main__':
     application.run(
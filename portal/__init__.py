@@ -4,8 +4,15 @@ import sys
 import os
 import datetime
 import csv
+import collections
 import io
-from operator import attrgetter
+import base64
+import json
+import hashlib
+import threading
+import time
+import gzip
+import mimetypes
 
 import pytz
 from flask import (
@@ -16,21 +23,32 @@ from flask import (
     render_template,
     request,
     Response,
+    safe_join,
     send_from_directory,
     session,
+    stream_with_context,
     url_for,
 )
 from flask_restful import Api, Resource
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import contains_eager, selectinload
+from werkzeug.exceptions import NotFound
+from werkzeug.http import quote_etag
+import sqlalchemy
+from sqlalchemy import and_, or_, func, literal, tuple_
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import (
+    aliased,
+    Session,
+    contains_eager,
+    make_transient_to_detached,
+)
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 from flask_sqlalchemy import SQLAlchemy, _QueryProperty
-from flask_oauthlib.client import OAuth
-import requests
-import bleach
-import markdown2
 
 from . import model as m
+from .cache import SnapshotCache, TemplateCache, TTLCache
+from .events import Broadcaster
+from .intake import Deduplicator, GroupCommit, RateLimiter
+from .upstream import Upstream, UpstreamError
 # Default ordering for admin types
 m.Semesters.order_by = m.Semesters.start_date.desc()
 m.Professors.order_by = m.Professors.last_first
@@ -38,30 +56,80 @@ m.Courses.order_by = m.Courses.number
 m.Sections.order_by = m.Sections.number
 m.ProblemTypes.order_by = m.ProblemTypes.description
 m.Messages.order_by = m.Messages.end_date.desc()
+# Keyset pagination keys for admin types
+# (expression, descending) pairs ending in the primary key, null-free
+m.Semesters.page_keys = [
+    (m.Semesters.start_date, True),
+    (m.Semesters.id, True),
+]
+m.Professors.page_keys = [
+    (m.Professors.last_first, False),
+    (m.Professors.id, False),
+]
+m.Courses.page_keys = [
+    (m.Courses.number, False),
+    (m.Courses.id, False),
+]
+m.Sections.page_keys = [
+    (m.Semesters.start_date, True),
+    (m.Courses.number, False),
+    (m.Sections.number, False),
+    (m.Sections.id, False),
+]
+m.ProblemTypes.page_keys = [
+    (m.ProblemTypes.description, False),
+    (m.ProblemTypes.id, False),
+]
+m.Messages.page_keys = [
+    (func.coalesce(m.Messages.end_date, datetime.date.max), True),
+    (m.Messages.id, True),
+]
+m.Tutors.page_keys = [
+    (func.coalesce(m.Tutors.is_active, False), True),
+    (func.coalesce(m.Tutors.is_working, False), True),
+    (func.coalesce(m.Tutors.is_superuser, False), True),
+    (func.coalesce(m.Tutors.last_first, ''), False),
+    (m.Tutors.id, False),
+]
+m.Tickets.page_keys = [
+    (m.Tickets.time_created, True),
+    (m.Tickets.id, True),
+]
 
 # Create App
 app = Flask(__name__)
 api = Api(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL', 'sqlite:///:memory:')
+# Template settings, also used by `flask compile-templates` at deploy time
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
+app.jinja_env.bytecode_cache = TemplateCache(os.environ.get(
+    'TEMPLATE_CACHE_DIR',
+    os.path.join(os.path.dirname(__file__), 'template_cache')))
 # Attach Database
 db = SQLAlchemy(app)
 db.Model = m.Base
 # Ugly code to make Base.query work
 m.Base.query_class = db.Query
 m.Base.query = _QueryProperty(db)
-# Configure Google OAuth
-oauth = OAuth()
-google = oauth.remote_app(
-    'google',
-    app_key='GOOGLE',
-    request_token_params={'scope': 'email'},
-    base_url='https://www.googleapis.com/oauth2/v1/',
-    request_token_url=None,
-    access_token_method='POST',
-    access_token_url='https://accounts.google.com/o/oauth2/token',
-    authorize_url='https://accounts.google.com/o/oauth2/auth',
-)
+# Google OAuth client, created by get_google() on first login
+google = None
+# Pooled, time bounded clients for the Google services called while serving
+# connections are only made, and requests imported, on first use
+recaptcha = Upstream('reCAPTCHA')
+google_api = Upstream('Google API')
+# Snapshots of the status board data, invalidated by ticket/tutor writes
+# max_age bounds how long writes made by other workers go unnoticed
+status_cache = SnapshotCache(max_age=60)
+# Pick lists for forms, invalidated by admin and tutor edits
+reference_cache = SnapshotCache(max_age=300)
+# Column values of logged in tutors by email, saves a query per request
+# the ttl bounds how long a change made by another worker goes unnoticed
+user_cache = TTLCache(ttl=30)
+# Pushes status board changes to the /api/stream listeners of this worker
+broadcaster = Broadcaster()
 
 # bleach config
 BLEACH_ALLOWED_TAGS = [
@@ -116,72 +184,353 @@ BLEACH_ALLOWED_STYLES = [
 ]
 
 
-@app.before_first_request
-def create_app():
+# these settings are stored in the configuration table
+# values here are defaults (and should all be strings or null)
+# defaults will autopopulate the database when first initialized
+# when run subsequently, they will be populated from the database
+# changes are applied by every worker once CONFIG_VERSION is changed
+default_config = {
+    # change to any other value to reload the settings without a restart
+    'CONFIG_VERSION': '0',
+
+    # key used to encrypt cookies
+    'SECRET_KEY': os.urandom(24),
+
+    # cookie lifetime in minutes, unused
+    'PERMANENT_SESSION_LIFETIME': '30',
+
+    # Google OAth client ID
+    'GOOGLE_CONSUMER_KEY': None,
+
+    # Google OAuth client secret
+    'GOOGLE_CONSUMER_SECRET': None,
+
+    # Google CAPTCHA site key
+    'GOOGLE_CAPTCHA_KEY': None,
+
+    # Google CAPTCHA secret key
+    'GOOGLE_CAPTCHA_SECRET': None,
+
+    # how CAPTCHA responses are verified
+    # 'google' calls reCAPTCHA, 'stub' accepts any response
+    # without a network call and is only for offline load testing
+    'CAPTCHA_VERIFIER': 'google',
+
+    # what to do with new tickets while reCAPTCHA is unreachable
+    # 'reject' turns them away, 'accept' lets them through
+    'CAPTCHA_FAILURE_MODE': 'reject',
+
+    # Timezone configuration,
+    # determines how times are displayed to users
+    # timestamps are always stored in UTC
+    # uses pytz timezone names
+    'TZ_NAME': 'America/Chicago',
+
+    # number of items on each page for reports
+    'PAGE_LENGTH': '100',
+
+    # milliseconds a new ticket may wait for others to be
+    # inserted with it in a single commit, 0 disables batching
+    'TICKET_BATCH_WAIT': '0',
+
+    # largest number of tickets inserted in a single commit
+    'TICKET_BATCH_SIZE': '50',
+
+    # seconds in which resubmitting the same ticket (same email,
+    # section and question) is collapsed into the first submission
+    'TICKET_DUPLICATE_WINDOW': '60',
+
+    # tickets each student email may open per minute
+    # after the first TICKET_RATE_BURST tickets they may open at once
+    'TICKET_RATE': '6',
+    'TICKET_RATE_BURST': '3',
+
+    # tickets each client address may open per minute, a whole lab
+    # behind one NAT address shares this, whatever emails are typed
+    'TICKET_ADDRESS_RATE': '60',
+    'TICKET_ADDRESS_BURST': '30',
+}
+
+# Parsed, typed view of the settings used while serving requests
+Settings = collections.namedtuple('Settings', [
+    'version',
+    'session_lifetime',
+    'tz',
+    'page_length',
+    'captcha_verifier',
+    'captcha_failure_mode',
+    'ticket_batch_wait',
+    'ticket_batch_size',
+    'ticket_duplicate_window',
+    'ticket_rate',
+    'ticket_rate_burst',
+    'ticket_address_rate',
+    'ticket_address_burst',
+])
+
+
+def parse_settings(config):
+    r"""
+    Converts the string settings from the configuration table
+    """
+    try:
+        tz = pytz.timezone(config['TZ_NAME'])
+    except pytz.exceptions.UnknownTimeZoneError:
+        print('Unknown timzeone: "{}". Using UTC instead.'.format(
+            config['TZ_NAME']
+        ), file=sys.stderr)
+        tz = pytz.utc
+
+    return Settings(
+        version=config['CONFIG_VERSION'],
+        session_lifetime=datetime.timedelta(
+            minutes=int(config['PERMANENT_SESSION_LIFETIME'])),
+        tz=tz,
+        page_length=int(config['PAGE_LENGTH']),
+        captcha_verifier=config['CAPTCHA_VERIFIER'],
+        captcha_failure_mode=config['CAPTCHA_FAILURE_MODE'],
+        ticket_batch_wait=int(config['TICKET_BATCH_WAIT']) / 1000,
+        ticket_batch_size=int(config['TICKET_BATCH_SIZE']),
+        ticket_duplicate_window=int(config['TICKET_DUPLICATE_WINDOW']),
+        ticket_rate=int(config['TICKET_RATE']),
+        ticket_rate_burst=int(config['TICKET_RATE_BURST']),
+        ticket_address_rate=int(config['TICKET_ADDRESS_RATE']),
+        ticket_address_burst=int(config['TICKET_ADDRESS_BURST']),
+    )
+
+
+app.settings = parse_settings(default_config)
+# set by create_app once the app is ready to serve
+app.startup_time = None
+
+
+def load_config():
+    r"""
+    Reads all settings from the configuration table with one query
+    Missing settings are added with their defaults in one insert
+    """
+    config = dict(default_config)
+    stored = dict(
+        db.session.query(m.Config.name, m.Config.value).
+        filter(m.Config.name.in_(config)))
+    missing = [
+        {'name': name, 'value': value}
+        for name, value in config.items()
+        if name not in stored
+    ]
+    if missing:
+        db.session.bulk_insert_mappings(m.Config, missing)
+        db.session.commit()
+    config.update(stored)
+    return config
+
+
+def update_config(config):
     r"""
-    Sets up app for use
+    Copies the raw settings Flask and OAuth read into app.config
+    PERMANENT_SESSION_LIFETIME is left to apply_settings,
+        Flask needs it as a timedelta and must never see the string
+    """
+    app.config.update({
+        name: value for name, value in config.items()
+        if name != 'PERMANENT_SESSION_LIFETIME'
+    })
+
+
+def apply_settings(settings):
+    r"""
+    Makes settings the ones used while serving requests
+    """
+    app.settings = settings
+    app.config['PERMANENT_SESSION_LIFETIME'] = settings.session_lifetime
+    ticket_intake.max_wait = settings.ticket_batch_wait
+    ticket_intake.max_batch = settings.ticket_batch_size
+    ticket_duplicates.window = settings.ticket_duplicate_window
+    ticket_admission.rate = settings.ticket_rate
+    ticket_admission.burst = settings.ticket_rate_burst
+    address_admission.rate = settings.ticket_address_rate
+    address_admission.burst = settings.ticket_address_burst
+
+
+# seconds between checks of CONFIG_VERSION, per worker
+CONFIG_CHECK_INTERVAL = 10
+config_check = threading.Lock()
+config_checked = time.monotonic()
+
+
+@app.before_request
+def reload_config():
+    r"""
+    Reloads the settings if CONFIG_VERSION changed
+    Checked at most every CONFIG_CHECK_INTERVAL seconds by a single request,
+        other requests carry on with the current settings meanwhile
+    """
+    global config_checked
+    if time.monotonic() - config_checked < CONFIG_CHECK_INTERVAL:
+        return
+    if not config_check.acquire(blocking=False):
+        return
+    try:
+        config_checked = time.monotonic()
+        version = db.session.query(m.Config.value).\
+            filter(m.Config.name == 'CONFIG_VERSION').\
+            scalar()
+        if version is None or version == app.settings.version:
+            return
+
+        config = load_config()
+        try:
+            settings = parse_settings(config)
+        except (KeyError, TypeError, ValueError) as e:
+            print('Invalid configuration, keeping the current settings: '
+                  '{!r}'.format(e), file=sys.stderr)
+            return
+        update_config(config)
+        apply_settings(settings)
+        # cached data depends on the timezone
+        status_cache.invalidate()
+        reference_cache.invalidate()
+    finally:
+        config_check.release()
+
+
+def create_app(config=None):
+    r"""
+    Sets up app for use and returns it
     Adds database configuration and the secret key
+    Everything is loaded and warmed up here, before the worker
+        accepts traffic, instead of during the first request
+    config may override app.config, e.g. SQLALCHEMY_DATABASE_URI
     """
-    app.jinja_env.trim_blocks = True
-    app.jinja_env.lstrip_blocks = True
+    if app.startup_time is not None:
+        return app
+    started = time.perf_counter()
+    if config:
+        app.config.update(config)
 
     # setup config values
     with app.app_context():
         # setup Database
         db.create_all()
-        # these settings are stored in the configuration table
-        # values here are defaults (and should all be strings or null)
-        # defaults will autopopulate the database when first initialized
-        # when run subsequently, they will be populated from the database
-        # only populated on startup, changes not applied until restart
-        config = {
-            # key used to encrypt cookies
-            'SECRET_KEY': os.urandom(24),
-
-            # cookie lifetime in minutes, unused
-            'PERMANENT_SESSION_LIFETIME': '30',
-
-            # Google OAth client ID
-            'GOOGLE_CONSUMER_KEY': None,
-
-            # Google OAuth client secret
-            'GOOGLE_CONSUMER_SECRET': None,
-
-            # Google CAPTCHA site key
-            'GOOGLE_CAPTCHA_KEY': None,
-
-            # Google CAPTCHA secret key
-            'GOOGLE_CAPTCHA_SECRET': None,
-
-            # Timezone configuration,
-            # determines how times are displayed to users
-            # timestamps are always stored in UTC
-            # uses pytz timezone names
-            'TZ_NAME': 'America/Chicago',
-
-            # number of items on each page for reports
-            'PAGE_LENGTH': '100',
-        }
-        # get Config values from database
-        for name in config:
-            try:
-                key = m.Config.query.filter_by(name=name).one()
-                config[name] = key.value
-            except NoResultFound:
-                key = m.Config(name=name, value=config[name])
-                db.session.add(key)
-                db.session.commit()
-
-        config['PERMANENT_SESSION_LIFETIME'] = datetime.timedelta(
-            minutes=int(config['PERMANENT_SESSION_LIFETIME']))
-        config['PAGE_LENGTH'] = int(config['PAGE_LENGTH'])
-        app.config.update(config)
-        try:
-            app.config['TZ'] = pytz.timezone(app.config['TZ_NAME'])
-        except pytz.exceptions.UnknownTimeZoneError:
-            print('Unknown timzeone: "{}". Using UTC instead.'.format(
-                app.config.get('TZ_NAME')
-            ), file=sys.stderr)
+        config = load_config()
+
+        upgrade_database()
+        render_messages()
+
+        settings = parse_settings(config)
+        update_config(config)
+        apply_settings(settings)
+
+        warm_up()
+
+    app.startup_time = time.perf_counter() - started
+    print('Started in {:.3f} seconds'.format(app.startup_time),
+          file=sys.stderr)
+    return app
+
+
+def warm_up():
+    r"""
+    Loads every template and the status board bundle
+        and opens the database connection pool
+    Templates come from the bytecode cache if compile-templates was run
+    """
+    global status_bundle
+    status_bundle = load_status_bundle()
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    # open as many connections as the pool keeps, then return them to it
+    size = getattr(db.engine.pool, 'size', lambda: 1)()
+    connections = [db.engine.connect() for _ in range(size)]
+    for connection in connections:
+        connection.close()
+
+
+@app.cli.command('compile-templates')
+def compile_templates():
+    r"""
+    Compiles every template into the bytecode cache
+    Prints how long each template takes to load without and with the cache
+    """
+    env = app.jinja_env
+    cache = env.bytecode_cache
+    cache.clear()
+    total = [0, 0]
+    for name in sorted(env.list_templates()):
+        timings = []
+        # the first load compiles and stores the bytecode, the second reads it
+        for _ in range(2):
+            env.cache.clear()
+            started = time.perf_counter()
+            env.get_template(name)
+            timings.append(time.perf_counter() - started)
+        total = [t + s for t, s in zip(total, timings)]
+        print('{:<28} {:8.2f} ms {:8.2f} ms'.format(
+            name, *(t * 1000 for t in timings)))
+    print('{:<28} {:8.2f} ms {:8.2f} ms'.format(
+        'total', *(t * 1000 for t in total)))
+
+
+def upgrade_database():
+    r"""
+    Adds columns and indexes introduced after a database was first created
+    db.create_all() only creates missing tables
+    """
+    new_columns = [
+        m.Messages.__table__.columns['message_html'],
+    ]
+    inspector = sqlalchemy.inspect(db.engine)
+    for column in new_columns:
+        table = column.table
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        if column.name not in existing:
+            create_missing(
+                lambda: column.name in {
+                    c['name'] for c in
+                    sqlalchemy.inspect(db.engine).get_columns(table.name)
+                },
+                lambda: db.engine.execute(
+                    'ALTER TABLE {} ADD COLUMN {} {}'.format(
+                        table.name,
+                        column.name,
+                        column.type.compile(dialect=db.engine.dialect),
+                    )))
+
+    for table in m.Base.metadata.sorted_tables:
+        existing = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                create_missing(
+                    lambda: index.name in {
+                        i['name'] for i in
+                        sqlalchemy.inspect(db.engine).get_indexes(table.name)
+                    },
+                    lambda: index.create(db.engine))
+
+
+def create_missing(exists, create):
+    r"""
+    Runs create(), ignoring the error if exists() shows that
+        another worker starting at the same time created it first
+    """
+    try:
+        create()
+    except DBAPIError:
+        if not exists():
+            raise
+
+
+def render_messages():
+    r"""
+    Renders the HTML of any messages saved before it was stored
+    """
+    messages = m.Messages.query.filter(m.Messages.html.is_(None)).all()
+    for message in messages:
+        message.html = markdown(message.message or '')
+    if messages:
+        db.session.commit()
 
 
 def make_safe(html):
@@ -189,6 +538,8 @@ def make_safe(html):
     Uses the bleach module to clean an HTML string
     Helps prevent javascript injection
     """
+    # imported on first use, most workers never render markdown
+    import bleach
     return bleach.clean(
         html,
         tags=BLEACH_ALLOWED_TAGS,
@@ -202,6 +553,7 @@ def markdown(md):
     r"""
     Outputs safe markdown using the markdown2 and bleach modules
     """
+    import markdown2
     html = markdown2.markdown(md, html4tags=True, extras=[
         'cuddled-lists',
         'fenced-code-blocks',
@@ -220,9 +572,7 @@ def correct_time(time):
         corrected for the appropriate timezone
     """
     if time is not None:
-        timezone = app.config.get('TZ')
-        if timezone is not None:
-            time = time.astimezone(timezone)
+        time = time.astimezone(app.settings.tz)
     return time
 
 
@@ -272,6 +622,99 @@ def get_str(string):
     return None if string == '' else string
 
 
+def page_token(direction, id):
+    r"""
+    Encodes a page position as an opaque token for URLs
+    direction is 'n' for rows after id or 'p' for rows before id
+    """
+    text = '{}:{}'.format(direction, id)
+    return base64.urlsafe_b64encode(text.encode('ascii')).decode('ascii')
+
+
+def read_page_token(token):
+    r"""
+    Decodes a page token, returning (None, None) for invalid tokens
+    """
+    try:
+        text = base64.urlsafe_b64decode(token.encode('ascii'))
+        direction, id = text.decode('ascii').split(':')
+        if direction not in ('n', 'p'):
+            raise ValueError('Invalid page direction: {}'.format(direction))
+        return direction, int(id)
+    except (AttributeError, ValueError):
+        return None, None
+
+
+def keyset_after(keys, values):
+    r"""
+    Filter for the rows that sort after values
+    keys are (expression, descending) pairs
+    """
+    values = [literal(value, key.type) for (key, _), value in zip(keys, values)]
+    if len({desc for _, desc in keys}) == 1:
+        # a single row comparison can use a composite index directly
+        columns = tuple_(*[key for key, _ in keys])
+        row = tuple_(*values)
+        return columns < row if keys[0][1] else columns > row
+
+    clauses = []
+    for i, (key, desc) in enumerate(keys):
+        after = key < values[i] if desc else key > values[i]
+        equal = [k == v for (k, _), v in zip(keys[:i], values[:i])]
+        clauses.append(and_(*equal, after))
+    return or_(*clauses)
+
+
+def paginate(items, keys, limit, token):
+    r"""
+    Gets one page of a query using keyset pagination
+    keys are (expression, descending) pairs ending in the primary key
+    Returns the page's items and the tokens for the previous and next pages
+    """
+    items = items.order_by(None)
+    direction, id = read_page_token(token)
+    boundary = None
+    if id is not None:
+        boundary = items.\
+            filter(keys[-1][0] == id).\
+            with_entities(*[key for key, _ in keys]).\
+            first()
+    backward = boundary is not None and direction == 'p'
+
+    order = [(key, desc != backward) for key, desc in keys]
+    page = items
+    if boundary is not None:
+        page = page.filter(keyset_after(order, boundary))
+    page = page.order_by(*[key.desc() if desc else key for key, desc in order])
+    rows = page.limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    if backward:
+        if not more:
+            # reached the start, show a full first page instead
+            return paginate(items, keys, limit, None)
+        rows.reverse()
+        prev = page_token('p', rows[0].id)
+        next = page_token('n', rows[-1].id)
+    else:
+        prev = page_token('p', rows[0].id) \
+            if boundary is not None and rows else None
+        next = page_token('n', rows[-1].id) if more else None
+    return rows, prev, next
+
+
+def cached_count(items, name):
+    r"""
+    Counts the rows of a query, reusing the count until the next write
+    Counts are stored per name and request arguments other than the page
+    """
+    args = tuple(sorted(
+        (key, value) for key, value in request.args.items(multi=True)
+        if key != 'page'))
+    return status_cache.get(('count', name, args), items.count)
+
+
 @app.context_processor
 def context():
     r"""
@@ -340,6 +783,17 @@ def five_hundred(e):
     return error('500: ' + type(e).__name__, message), 500
 
 
+def detached(type, data):
+    r"""
+    Recreates a database object from cached column values
+    The object is kept out of the session, so queries made later
+        in the request still load fresh rows instead of returning it
+    """
+    obj = type(**data)
+    make_transient_to_detached(obj)
+    return obj
+
+
 def get_user():
     r"""
     Gets the user data from the current session
@@ -351,11 +805,16 @@ def get_user():
         if app.debug:
             user = m.Tutors(email=email, is_active=True, is_superuser=True)
         else:
-            try:
-                user = m.Tutors.query.filter_by(email=email).one()
-            except NoResultFound:
-                session.clear()
-                flash('&#10006; User does not exist: {}.'.format(email))
+            data = user_cache.get(email)
+            if data is not None:
+                user = detached(m.Tutors, data)
+            else:
+                try:
+                    user = m.Tutors.query.filter_by(email=email).one()
+                    user_cache.set(email, user.dict())
+                except NoResultFound:
+                    session.clear()
+                    flash('&#10006; User does not exist: {}.'.format(email))
 
         if user and not user.is_active:
             session.clear()
@@ -376,6 +835,103 @@ def favicon():
     )
 
 
+# static files that are worth storing compressed
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.txt', '.ico', '.html')
+# digests of the static files by filename, they only change on deploy
+static_digests = {}
+
+
+def static_digest(filename):
+    r"""
+    Returns a short hash of the content of a static file
+    Returns None for files that do not exist
+    """
+    digest = static_digests.get(filename)
+    if digest is None:
+        try:
+            with open(safe_join(app.static_folder, filename), 'rb') as f:
+                digest = hashlib.sha1(f.read()).hexdigest()[:12]
+        except (OSError, NotFound):
+            return None
+        static_digests[filename] = digest
+    return digest
+
+
+@app.url_defaults
+def static_version(endpoint, values):
+    r"""
+    Adds the content hash to static file URLs as ?v=
+    The URL then changes whenever the file does
+    """
+    if endpoint == 'static' and 'v' not in values:
+        digest = static_digest(values.get('filename', ''))
+        if digest is not None:
+            values['v'] = digest
+
+
+@app.endpoint('static')
+def static_file(filename):
+    r"""
+    Serves static files, precompressed if the browser accepts it
+    URLs with the current content hash are cached forever
+    """
+    variants = (('br', '.br'), ('gzip', '.gz'))
+    for encoding, suffix in variants:
+        variant = safe_join(app.static_folder, filename + suffix)
+        if request.accept_encodings[encoding] and os.path.isfile(variant):
+            response = send_from_directory(
+                app.static_folder, filename + suffix,
+                mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(app.static_folder, filename)
+    response.vary.add('Accept-Encoding')
+
+    if request.args.get('v') and \
+            request.args.get('v') == static_digest(filename):
+        response.headers['Cache-Control'] = \
+            'public, max-age=31536000, immutable'
+    return response
+
+
+@app.cli.command('compress-static')
+def compress_static():
+    r"""
+    Writes gzip and, if the brotli module is installed, brotli variants
+        of the compressible static files next to them
+    Variants that are not smaller than the file are not kept
+    """
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print('brotli is not installed, only writing gzip variants')
+
+    for root, dirs, files in os.walk(app.static_folder):
+        for name in files:
+            if not name.endswith(COMPRESSIBLE):
+                continue
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            variants = {'.gz': gzip.compress(data, 9)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(data)
+            sizes = []
+            for suffix, compressed in sorted(variants.items()):
+                if len(compressed) < len(data):
+                    with open(path + suffix, 'wb') as f:
+                        f.write(compressed)
+                elif os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+                sizes.append('{} {:>8}'.format(suffix, len(compressed)))
+            print('{:<40} {:>8}  {}'.format(
+                os.path.relpath(path, app.static_folder), len(data),
+                '  '.join(sizes)))
+
+
 # ----#-   Pages
 @app.route('/')
 def index():
@@ -408,10 +964,210 @@ def status():
     html = render_template(
         'status.html',
         user=user,
+        bundle=status_bundle and status_bundle[0],
     )
     return html
 
 
+# files built by `npm run build`, joined into the status board bundle
+STATUS_BUNDLE_FILES = [
+    'react/react.production.min.js',
+    'react/react-dom.production.min.js',
+    'babel/status.js',
+]
+# (digest, body, gzipped body) of the status board bundle
+# None if it was not built
+status_bundle = None
+
+
+def load_status_bundle():
+    r"""
+    Joins the production React builds and the compiled status board
+    Returns None if the files have not been built
+    """
+    parts = []
+    for filename in STATUS_BUNDLE_FILES:
+        try:
+            with open(os.path.join(app.static_folder, filename), 'rb') as f:
+                parts.append(f.read())
+        except FileNotFoundError:
+            return None
+    body = b';\n'.join(parts)
+    return hashlib.sha1(body).hexdigest()[:12], body, gzip.compress(body, 9)
+
+
+@app.route('/bundle/status.<digest>.js')
+def status_script(digest):
+    r"""
+    Serves the status board bundle
+    The digest changes with the content, so it may be cached forever
+    """
+    if status_bundle is None:
+        return abort(404)
+    current, body, gzipped = status_bundle
+    if digest != current:
+        return redirect(url_for('status_script', digest=current))
+
+    headers = {
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'Vary': 'Accept-Encoding',
+    }
+    if request.accept_encodings['gzip']:
+        body = gzipped
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, mimetype='application/javascript', headers=headers)
+
+
+def current_messages(today):
+    r"""
+    Gets the rendered messages to display on the given day
+    """
+    tomorrow = today + datetime.timedelta(days=1)
+
+    messages = m.Messages.query.filter(
+        (
+            (m.Messages.start_date <= tomorrow) |
+            (m.Messages.start_date.is_(None))
+        ) &
+        (
+            (m.Messages.end_date >= today) |
+            (m.Messages.end_date.is_(None))
+        )
+    ).order_by(m.Messages.order_by).all()
+
+    return list(map(
+        lambda a: markdown(a.message) if a.html is None else a.html,
+        messages))
+
+
+def course_availability():
+    r"""
+    Gets the current number of tickets and working tutors for each course
+    """
+    courses = m.Courses.query.\
+        order_by(m.Courses.order_by).\
+        filter(m.Courses.on_display == True).\
+        all()
+
+    # current tickets for every course in one grouped query
+    tickets = dict(db.session.query(
+        m.Sections.course_id,
+        func.count(m.Tickets.id),
+    ).join(m.Tickets.section).
+        filter(m.is_active(m.Tickets.status)).
+        group_by(m.Sections.course_id).
+        all())
+
+    # working tutors for every course in one grouped query
+    course_id = m.can_tutor_table.columns['course_id']
+    tutors = dict(db.session.query(
+        course_id,
+        func.count(m.Tutors.id),
+    ).join(m.Tutors).
+        filter(m.Tutors.is_working == True).
+        group_by(course_id).
+        all())
+
+    total_tickets = sum(tickets.values())
+    displayed_tickets = sum(tickets.get(c.id, 0) for c in courses)
+
+    courses = list(map(lambda a: {
+        'name': str(a),
+        'current_tickets': tickets.get(a.id, 0),
+        'current_tutors': tutors.get(a.id, 0),
+    }, courses))
+    courses.extend([
+        {
+            'name': 'Other',
+            'current_tickets': total_tickets - displayed_tickets,
+            'current_tutors': '-',
+        },
+        {
+            'name': 'Total',
+            'current_tickets': total_tickets,
+            'current_tutors': m.Tutors.query.filter_by(is_working=True).count(),
+        }
+    ])
+    return courses
+
+
+def tagged(data):
+    r"""
+    Pairs JSON serializable data with a strong ETag of its contents
+    """
+    body = json.dumps(data, sort_keys=True).encode('utf-8')
+    return data, hashlib.sha1(body).hexdigest()
+
+
+def conditional(data, etag):
+    r"""
+    Returns data for a Resource, tagged with etag
+    Returns an empty 304 response if the client already has the data
+    """
+    if etag in request.if_none_match:
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+    return data, 200, {
+        'ETag': quote_etag(etag),
+        'Cache-Control': 'no-cache',
+    }
+
+
+def course_changes(old, new):
+    r"""
+    Gets the rows of the course availability table that changed
+    Returns None if rows were added, removed or reordered
+    """
+    if [c['name'] for c in old] != [c['name'] for c in new]:
+        return None
+    return [c for c, o in zip(new, old) if c != o]
+
+
+def publish_status():
+    r"""
+    Sends any changes in the status board data to the stream listeners
+    """
+    today = now_today()
+    messages, _ = status_cache.get(
+        ('messages', today), lambda: tagged(current_messages(today)))
+    courses, _ = status_cache.get(
+        'courses', lambda: tagged(course_availability()))
+    broadcaster.publish('messages', messages)
+    broadcaster.publish('courses', courses, diff=course_changes)
+
+
+def status_changed():
+    r"""
+    Invalidates the status board data after a committed write
+    """
+    status_cache.invalidate()
+    if broadcaster.listeners:
+        publish_status()
+
+
+status_watcher = threading.Lock()
+
+
+def watch_status():
+    r"""
+    Starts the background thread that republishes the status board data
+    Picks up writes made by other workers and messages changing by date
+    Only one thread is started per worker, regardless of listener count
+    """
+    def watch():
+        while True:
+            time.sleep(status_cache.max_age)
+            if broadcaster.listeners:
+                with app.app_context():
+                    publish_status()
+
+    if status_watcher.acquire(blocking=False):
+        thread = threading.Thread(target=watch, name='status-watcher')
+        thread.daemon = True
+        thread.start()
+
+
 @api.resource('/api/messages')
 class Messages (Resource):
     '''
@@ -419,20 +1175,9 @@ class Messages (Resource):
     '''
     def get(self):
         today = now_today()
-        tomorrow = today + datetime.timedelta(days=1)
-
-        messages = m.Messages.query.filter(
-            (
-                (m.Messages.start_date <= tomorrow) |
-                (m.Messages.start_date.is_(None))
-            ) &
-            (
-                (m.Messages.end_date >= today) |
-                (m.Messages.end_date.is_(None))
-            )
-        ).order_by(m.Messages.order_by).all()
-
-        return list(map(lambda a: markdown(a.message), messages))
+        data, etag = status_cache.get(
+            ('messages', today), lambda: tagged(current_messages(today)))
+        return conditional(data, etag)
 
 
 @api.resource('/api/courses')
@@ -441,45 +1186,67 @@ class Courses (Resource):
     Course table with name, current tickets, and current tutors for each course
     '''
     def get(self):
-        courses = m.Courses.query.\
-            order_by(m.Courses.order_by).\
-            filter(m.Courses.on_display == True).\
-            all()
+        data, etag = status_cache.get(
+            'courses', lambda: tagged(course_availability()))
+        return conditional(data, etag)
+
+
+@app.route('/api/stream')
+def status_stream():
+    r"""
+    Server-Sent Events stream of changes to messages and course availability
+    """
+    watch_status()
+    publish_status()
+    last_id = broadcaster.parse_id(request.headers.get('Last-Event-ID'))
+    return Response(
+        broadcaster.listen(last_id),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        },
+    )
 
-        for course in courses:
-            course.current_tickets = m.Tickets.query.filter(
-                m.Tickets.status.in_((None, m.Status.Open, m.Status.Claimed))
-            ).join(m.Sections).filter_by(course=course).count()
 
-            course.current_tutors = m.Tutors.query.\
-                filter_by(is_working=True).\
-                join(m.can_tutor_table).\
-                filter(course.id == m.can_tutor_table.columns['course_id']).count()
+@api.resource('/api/stats')
+class Stats (Resource):
+    '''
+    Cache, client and intake counters for monitoring
+    '''
+    def get(self):
+        return {
+            'status_cache': status_cache.stats(),
+            'stream_listeners': broadcaster.listeners,
+            'startup_seconds': app.startup_time,
+            'user_cache': user_cache.stats(),
+            'reference_cache': reference_cache.stats(),
+            'recaptcha': recaptcha.stats(),
+            'google_api': google_api.stats(),
+            'ticket_intake': ticket_intake.stats(),
+            'ticket_duplicates': ticket_duplicates.stats(),
+            'ticket_admission': ticket_admission.stats(),
+            'address_admission': address_admission.stats(),
+        }
 
-        other_tickets = m.Tickets.query.\
-            filter(m.Tickets.status.in_((None, m.Status.Open, m.Status.Claimed))).\
-            join(m.Sections).\
-            filter(~m.Sections.course_id.in_(map(attrgetter('id'), courses))).\
-            count()
-
-        courses = list(map(lambda a: {
-            'name': str(a),
-            'current_tickets': a.current_tickets,
-            'current_tutors': a.current_tutors,
-        }, courses))
-        courses.extend([
-            {
-                'name': 'Other',
-                'current_tickets': other_tickets,
-                'current_tutors': '-',
-            },
-            {
-                'name': 'Total',
-                'current_tickets': sum(c['current_tickets'] for c in courses) + other_tickets,
-                'current_tutors': m.Tutors.query.filter_by(is_working=True).count(),
-            }
-        ])
-        return courses
+
+def reference(key, load):
+    r"""
+    Gets cached reference data for forms, calling load(session) if missing
+    load runs in its own session which is closed afterwards,
+        so the cached objects are detached and never expired by a commit
+    That session uses the connection of the request's session,
+        closing it leaves the request's transaction and flushes alone
+        and a cache miss does not take a second connection from the pool
+    The objects are shared between requests and must not be modified
+    """
+    def compute():
+        session = Session(bind=db.session.connection())
+        try:
+            return load(session)
+        finally:
+            session.close()
+    return reference_cache.get(key, compute)
 
 
 def get_open_courses():
@@ -488,13 +1255,69 @@ def get_open_courses():
     """
     today = now_today()
     tomorrow = today + datetime.timedelta(days=1)
-    return m.Courses.query.join(m.Sections).join(m.Semesters).\
-        order_by(m.Courses.number).\
-        order_by(m.Sections.number).\
-        filter(m.Semesters.start_date <= tomorrow).\
-        filter(m.Semesters.end_date >= today).\
-        options(contains_eager(m.Courses.sections)).\
-        all()
+
+    def load(session):
+        return session.query(m.Courses).\
+            join(m.Sections).\
+            join(m.Semesters).\
+            order_by(m.Courses.number).\
+            order_by(m.Sections.number).\
+            filter(m.Semesters.start_date <= tomorrow).\
+            filter(m.Semesters.end_date >= today).\
+            options(
+                contains_eager(m.Courses.sections).
+                contains_eager(m.Sections.course),
+                contains_eager(m.Courses.sections).
+                contains_eager(m.Sections.semester)).\
+            all()
+    # keyed by date so the list changes when a semester starts or ends
+    return reference(('open_courses', today), load)
+
+
+def get_courses(displayed=False):
+    r"""
+    Gets a list of all courses, or only those displayed on the status page
+    """
+    def load(session):
+        courses = session.query(m.Courses).order_by(m.Courses.order_by)
+        if displayed:
+            courses = courses.filter(m.Courses.on_display == True)
+        return courses.all()
+    return reference(('courses', displayed), load)
+
+
+def get_problem_types():
+    r"""
+    Gets a list of the problem types
+    """
+    def load(session):
+        return session.query(m.ProblemTypes).\
+            order_by(m.ProblemTypes.order_by).\
+            all()
+    return reference('problem_types', load)
+
+
+def get_semesters():
+    r"""
+    Gets a list of the semesters
+    """
+    def load(session):
+        return session.query(m.Semesters).\
+            order_by(m.Semesters.order_by).\
+            all()
+    return reference('semesters', load)
+
+
+def get_active_tutors():
+    r"""
+    Gets a list of the currently employed tutors
+    """
+    def load(session):
+        return session.query(m.Tutors).\
+            filter_by(is_active=True).\
+            order_by(m.Tutors.last_first).\
+            all()
+    return reference('active_tutors', load)
 
 
 @app.route('/open_ticket/')
@@ -505,7 +1328,7 @@ def open_ticket():
     user = get_user()
 
     courses = get_open_courses()
-    problems = m.ProblemTypes.query.order_by(m.ProblemTypes.order_by).all()
+    problems = get_problem_types()
 
     html = render_template(
         'edit_open_ticket.html',
@@ -516,24 +1339,53 @@ def open_ticket():
     return html
 
 
-@app.route('/open_ticket/', methods=['POST'])
-def save_open_ticket():
+def verify_captcha(response):
     r"""
-    Creates a new ticket and stores it in the database
+    Checks a reCAPTCHA response token
+    Raises an UpstreamError if reCAPTCHA could not be reached
     """
-    https = requests.post(
+    if app.settings.captcha_verifier == 'stub':
+        return bool(response)
+
+    https = recaptcha.post(
         'https://www.google.com/recaptcha/api/siteverify',
         data={
             'secret': app.config['GOOGLE_CAPTCHA_SECRET'],
-            'response': request.form.get('g-recaptcha-response'),
+            'response': response,
         },
     )
     verification = https.json()
+    return bool(verification.get('success'))
 
-    if not verification.get('success'):
-        flash('&#10006; Invalid CAPTCHA response')
-        return redirect(url_for('index'))
 
+def insert_tickets(rows):
+    r"""
+    Inserts a batch of new tickets with one statement and one commit
+    """
+    # the form uses attribute names, the table uses column names
+    columns = m.Tickets.__mapper__.columns
+    rows = [{columns[k].key: v for k, v in row.items()} for row in rows]
+    with db.engine.begin() as connection:
+        connection.execute(m.Tickets.__table__.insert().values(rows))
+    status_changed()
+
+
+ticket_intake = GroupCommit(insert_tickets)
+ticket_duplicates = Deduplicator()
+# per student email, and per client address so changing the email
+# does not get past it
+ticket_admission = RateLimiter()
+address_admission = RateLimiter(rate=60, burst=30)
+
+
+@app.route('/open_ticket/', methods=['POST'])
+def save_open_ticket():
+    r"""
+    Creates a new ticket and stores it in the database
+    Repeated submissions of the same ticket are collapsed into the first
+        and clients opening too many tickets are turned away,
+        both before the CAPTCHA is verified
+    """
     ticket_form = {
         'student_email': get_str,
         'student_fname': get_str,
@@ -548,17 +1400,76 @@ def save_open_ticket():
     for key, value in ticket_form.items():
         form[key] = value(request.form.get(key))
 
+    submission = (
+        (form['student_email'] or '').lower(),
+        form['section_id'],
+        ' '.join((form['question'] or '').split()),
+    )
+    if ticket_duplicates.seen(submission):
+        flash('&#10004; Ticket successfully opened')
+        return redirect(url_for('index'))
+
+    # the last address is the one added by our own proxy, if any
+    address = request.access_route[-1]
+    if not (address_admission.allow(address) and
+            ticket_admission.allow(submission[0])):
+        ticket_duplicates.forget(submission)
+        flash('&#10006; Too many tickets opened, please try again later')
+        return redirect(url_for('index'))
+
+    try:
+        verified = verify_captcha(request.form.get('g-recaptcha-response'))
+    except UpstreamError:
+        if app.settings.captcha_failure_mode != 'accept':
+            ticket_duplicates.forget(submission)
+            flash('&#10006; Could not verify the CAPTCHA, please try again')
+            return redirect(url_for('index'))
+        verified = True
+
+    if not verified:
+        ticket_duplicates.forget(submission)
+        flash('&#10006; Invalid CAPTCHA response')
+        return redirect(url_for('index'))
+
     form['status'] = m.Status.Open
     form['time_created'] = now()
 
-    ticket = m.Tickets(**form)
-    db.session.add(ticket)
-    db.session.commit()
+    try:
+        ticket_intake.submit(form)
+    except Exception:
+        ticket_duplicates.forget(submission)
+        raise
 
     flash('&#10004; Ticket successfully opened')
     return redirect(url_for('index'))
 
 
+def ticket_queues(today):
+    r"""
+    Gets the queries for the open and claimed tickets
+        and for the tickets closed since today
+    Neither is ordered, an ORDER BY time_created makes the database
+        walk ix_tickets_time_created instead of using the filter's index
+    """
+    tickets = m.Tickets.query.\
+        join(m.Sections).\
+        join(m.Semesters).\
+        join(m.Courses).\
+        options(
+            contains_eager(m.Tickets.section).
+            contains_eager(m.Sections.semester),
+            contains_eager(m.Tickets.section).
+            contains_eager(m.Sections.course))
+
+    # served by the partial index ix_tickets_active
+    active = tickets.filter(m.is_active(m.Tickets.status))
+    # served by ix_tickets_time_closed
+    closed = tickets.\
+        filter(m.Tickets.status == m.Status.Closed).\
+        filter(m.Tickets.time_closed >= today)
+    return active, closed
+
+
 @app.route('/tickets/')
 def view_tickets():
     r"""
@@ -568,29 +1479,12 @@ def view_tickets():
     if not user:
         return redirect(url_for('login', next=url_for('view_tickets')))
 
-    today = now_today()
-    tickets = m.Tickets.query.order_by(m.Tickets.time_created).\
-        join(m.Sections).\
-        join(m.Semesters).\
-        join(m.Courses).\
-        filter(
-            (m.Tickets.time_created >= today) |
-            (m.Tickets.time_closed >= today) |
-            (m.Tickets.status.in_((None, m.Status.Open, m.Status.Claimed)))).\
-        all()
-
-    open = []
-    claimed = []
-    closed = []
-    for ticket in tickets:
-        if ticket.status in (None, m.Status.Open):
-            open.append(ticket)
-        elif ticket.status == m.Status.Claimed:
-            claimed.append(ticket)
-        elif ticket.status == m.Status.Closed:
-            closed.append(ticket)
-        else:
-            raise ValueError('Invalid ticket status: {}'.format(ticket.status))
+    active, closed = ticket_queues(now_today())
+    # the index scans return tickets in index order, not by time created
+    active = sorted(active.all(), key=lambda t: t.time_created)
+    open = [t for t in active if t.status == m.Status.Open]
+    claimed = [t for t in active if t.status == m.Status.Claimed]
+    closed = sorted(closed.all(), key=lambda t: t.time_created)
 
     html = render_template(
         'list_tickets.html',
@@ -613,11 +1507,8 @@ def close_ticket(id):
 
     ticket = m.Tickets.query.filter_by(id=id).one()
     courses = get_open_courses()
-    problems = m.ProblemTypes.query.order_by(m.ProblemTypes.order_by).all()
-    tutors = m.Tutors.query.\
-        filter_by(is_active=True).\
-        order_by(m.Tutors.last_first).\
-        all()
+    problems = get_problem_types()
+    tutors = get_active_tutors()
 
     html = render_template(
         'edit_close_ticket.html',
@@ -630,10 +1521,28 @@ def close_ticket(id):
     return html
 
 
+def ticket_lost(id):
+    r"""
+    Tells the user a ticket was changed by someone else before their change
+    """
+    ticket = m.Tickets.query.get(id)
+    if ticket is None:
+        return abort(404)
+    if ticket.tutor is None:
+        flash('&#10006; Ticket was changed by someone else, please try again')
+    else:
+        flash('&#10006; Ticket already {} by {}'.format(
+            ticket.status.name.lower(), ticket.tutor.last_first))
+    return redirect(url_for('view_tickets'))
+
+
 @app.route('/tickets/close/', methods=['POST'])
 def save_close_ticket():
     r"""
     Saves changes to a ticket into the database
+    The change is only made if the status and tutor of the ticket
+        are still the ones shown on the form, so concurrent claims
+        are reported instead of overwriting each other
     """
     user = get_user()
     if not user:
@@ -644,8 +1553,8 @@ def save_close_ticket():
         'question': get_str,
         'session_duration': get_int,
         'was_successful': bool,
-        'tutor_id': get_str,
-        'assistant_tutor_id': get_str,
+        'tutor_id': get_int,
+        'assistant_tutor_id': get_int,
         'section_id': get_int,
         'problem_type_id': get_int,
     }
@@ -663,12 +1572,25 @@ def save_close_ticket():
         raise ValueError('Invalid submit type: {}'.format(form.get('submit')))
 
     id = get_int(request.form.get('id'))
-    ticket = m.Tickets.query.filter_by(id=id).one()
-
-    for key, value in form.items():
-        if getattr(ticket, key) != value:
-            setattr(ticket, key, value)
+    # forms rendered before the status was sent back have no old_status,
+    # an empty one is a ticket without a status
+    old_status = request.form.get('old_status')
+    if old_status is None or \
+            old_status and old_status not in m.Status.__members__:
+        return ticket_lost(id)
+    old_status = m.Status[old_status] if old_status else None
+    old_tutor_id = get_int(request.form.get('old_tutor_id'))
+
+    # compare and set in a single statement
+    changed = m.Tickets.query.\
+        filter(m.Tickets.id == id).\
+        filter(m.Tickets.status == old_status).\
+        filter(m.Tickets.tutor_id == old_tutor_id).\
+        update(form, synchronize_session=False)
     db.session.commit()
+    if not changed:
+        return ticket_lost(id)
+    status_changed()
 
     html = redirect(url_for('view_tickets'))
     return html
@@ -683,9 +1605,14 @@ def reopen_ticket(id):
     if not user:
         return abort(403)
 
-    ticket = m.Tickets.query.filter_by(id=id).one()
-    ticket.status = m.Status.Claimed
+    changed = m.Tickets.query.\
+        filter(m.Tickets.id == get_int(id)).\
+        filter(m.Tickets.status == m.Status.Closed).\
+        update({'status': m.Status.Claimed}, synchronize_session=False)
     db.session.commit()
+    if not changed:
+        return ticket_lost(id)
+    status_changed()
 
     return redirect(url_for('view_tickets'))
 
@@ -713,6 +1640,28 @@ def working_list():
     return html
 
 
+def set_working(working):
+    r"""
+    Makes the active tutors with ids in working the ones that are working
+    Returns the number of tutors that were changed
+    """
+    tutors = m.Tutors.query.filter(m.Tutors.is_active == True)
+    is_working = func.coalesce(m.Tutors.is_working, False)
+
+    changed = 0
+    if working:
+        changed += tutors.\
+            filter(m.Tutors.id.in_(working)).\
+            filter(is_working == False).\
+            update({m.Tutors.is_working: True}, synchronize_session=False)
+        tutors = tutors.filter(~m.Tutors.id.in_(working))
+    changed += tutors.\
+        filter(is_working == True).\
+        update({m.Tutors.is_working: False}, synchronize_session=False)
+    db.session.commit()
+    return changed
+
+
 @app.route('/workinglist', methods=['POST'])
 def submit_working():
     r"""
@@ -722,12 +1671,13 @@ def submit_working():
     if not user:
         return abort(403)
 
-    tutors = m.Tutors.query.filter_by(is_active=True).all()
+    # the form has a checkbox named by id for each active tutor
+    working = {get_int(key) for key in request.form}
+    working.discard(None)
 
-    for tutor in tutors:
-        tutor.is_working = bool(request.form.get(str(tutor.id), False))
-
-    db.session.commit()
+    if set_working(working):
+        status_changed()
+        user_cache.clear()
 
     html = redirect(url_for('working_list'))
     return html
@@ -744,6 +1694,8 @@ def deactivate_tutors():
 
     m.Tutors.query.update({m.Tutors.is_working: False})
     db.session.commit()
+    status_changed()
+    user_cache.clear()
 
     html = redirect(url_for('working_list'))
     return html
@@ -785,26 +1737,20 @@ def reports():
     if not user or not user.is_superuser:
         return abort(403)
 
-    limit = app.config['PAGE_LENGTH']
-    page = get_int(request.args.get('page'))
-    if page is None:
-        page = 1
-    offset = (page - 1) * limit
-
-    items = filter_report(request.args)
-    numItems = items.count()
-    items = items.limit(limit).offset(offset).all()
-    semesters = m.Semesters.query.order_by(m.Semesters.order_by).all()
-    courses = m.Courses.query.order_by(m.Courses.order_by).all()
-
-    maxPage = ((numItems - 1) // limit) + 1
-    if maxPage < 1:
-        maxPage = 1
-
     args = dict(request.args)
     if 'page' in args:
         args.pop('page')
 
+    items = filter_report(request.args)
+    numItems = cached_count(items, 'reports')
+    items, prev, next = paginate(
+        items,
+        m.Tickets.page_keys,
+        app.settings.page_length,
+        request.args.get('page'))
+    semesters = get_semesters()
+    courses = get_courses()
+
     html = render_template(
         'report.html',
         user=user,
@@ -813,15 +1759,17 @@ def reports():
         courses=courses,
 
         numItems=numItems,
-        page=page,
-        limit=limit,
-        offset=offset,
-        maxPage=maxPage,
+        prev=prev,
+        next=next,
         args=args,
     )
     return html
 
 
+# tickets fetched per database round trip when exporting reports
+REPORT_BATCH_SIZE = 1000
+
+
 def fix_dde(cell):
     '''
     Handles a vulnerability with embedded formulae in csv files
@@ -843,15 +1791,54 @@ def report_download():
     if not user or not user.is_superuser:
         return abort(403)
 
-    tickets = filter_report(request.args).\
+    return Response(
+        stream_with_context(report_csv(request.args)),
+        mimetype='text/csv',
+        headers={
+            'Content-disposition': 'attatchment; filename=cslc_report.csv',
+        },
+    )
+
+
+def report_csv(args):
+    r"""
+    Gets the tickets of the report filtered by args as chunks of CSV text
+    """
+    # plain column tuples are much cheaper than hydrating Tickets objects
+    tutor = aliased(m.Tutors)
+    assistant = aliased(m.Tutors)
+    columns = [
+        m.Tickets.id,
+        m.Tickets.student_email,
+        m.Tickets.student_fname,
+        m.Tickets.student_lname,
+        m.Tickets.assignment,
+        m.Tickets.question,
+        m.ProblemTypes.description,
+        m.Tickets.status,
+        m.Tickets.time_created,
+        m.Tickets.time_closed,
+        m.Tickets.was_successful,
+        tutor.id,
+        tutor.last_first,
+        tutor.email,
+        assistant.id,
+        assistant.last_first,
+        assistant.email,
+        m.Semesters.title,
+        m.Courses.number,
+        m.Sections.number,
+        m.Professors.last_first,
+    ]
+    tickets = filter_report(args).\
         join(m.ProblemTypes).\
         join(m.Courses).\
         join(m.Semesters).\
         join(m.Professors).\
-        options(
-            selectinload(m.Tickets.tutor),
-            selectinload(m.Tickets.assistant_tutor)).\
-        all()
+        outerjoin(tutor, m.Tickets.tutor_id == tutor.id).\
+        outerjoin(assistant, m.Tickets.assistant_tutor_id == assistant.id).\
+        with_entities(*columns).\
+        statement.execution_options(stream_results=True)
 
     headers = [
         'URL',
@@ -872,43 +1859,59 @@ def report_download():
         'Section Number',
         'Professor',
     ]
-    report = [headers]
-    for ticket in tickets:
-        ticket_url = url_for('ticket_details', id=ticket.id, _external=True)
-        elem = [
-            ticket_url,
-            ticket.student_email,
-            ticket.student_fname,
-            ticket.student_lname,
-            ticket.assignment,
-            ticket.question,
-            ticket.problem_type.description,
-            ticket.status.name if ticket.status else 'Unknown',
-            correct_time(ticket.time_created) or 'Unknown',
-            correct_time(ticket.time_closed) or 'Not closed yet',
-            ticket.was_successful,
-            ticket.tutor or 'None',
-            ticket.assistant_tutor or 'None',
-            ticket.section.semester.title,
-            ticket.section.course.number,
-            ticket.section.number,
-            ticket.section.professor.last_first,
-        ]
-        elem = map(fix_dde, elem)
-        elem = list(elem)
-        report.append(elem)
-
-    file = io.StringIO()
-    writer = csv.writer(file)
-    for line in report:
-        writer.writerow(line)
-    return Response(
-        file.getvalue(),
-        mimetype='text/csv',
-        headers={
-            'Content-disposition': 'attatchment; filename=cslc_report.csv',
-        },
-    )
+
+    # ticket URLs only differ by id, so url_for is called once
+    url_prefix = url_for(
+        'ticket_details', id=0, _external=True).rpartition('/')[0] + '/'
+    timezone = app.settings.tz
+
+    def local(time):
+        if time is not None:
+            time = time.astimezone(timezone)
+        return time
+
+    def tutor_name(id, last_first, email):
+        if id is None:
+            return 'None'
+        return '{}: {}'.format(last_first, email)
+
+    def generate():
+        file = io.StringIO()
+        writer = csv.writer(file)
+        writer.writerow(headers)
+        result = db.session.execute(tickets)
+        while True:
+            rows = result.fetchmany(REPORT_BATCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                elem = [
+                    url_prefix + str(row[0]),
+                    row[1],
+                    row[2],
+                    row[3],
+                    row[4],
+                    row[5],
+                    row[6],
+                    row[7].name if row[7] else 'Unknown',
+                    local(row[8]) or 'Unknown',
+                    local(row[9]) or 'Not closed yet',
+                    row[10],
+                    tutor_name(*row[11:14]),
+                    tutor_name(*row[14:17]),
+                    row[17],
+                    row[18],
+                    row[19],
+                    row[20],
+                ]
+                writer.writerow(map(fix_dde, elem))
+            # send rows in chunks so memory use does not grow with the report
+            yield file.getvalue()
+            file.seek(0)
+            file.truncate()
+        yield file.getvalue()
+
+    return generate()
 
 
 @app.route('/reports/ticket/<int:id>')
@@ -942,6 +1945,7 @@ def delete_ticket(id):
     obj = m.Tickets.query.filter_by(id=id).one()
     db.session.delete(obj)
     db.session.commit()
+    status_changed()
 
     return redirect(url_for('reports'))
 
@@ -986,29 +1990,21 @@ def list_admin(type):
         m.Messages: 'Messages',
     }.get(type)
 
-    limit = app.config['PAGE_LENGTH']
-    page = get_int(request.args.get('page'))
-    if page is None:
-        page = 1
-    offset = (page - 1) * limit
-
     items = type.query
     if type == m.Sections:
         items = items.join(m.Semesters)
         items = items.join(m.Courses)
-        items = items.order_by(m.Semesters.order_by)
-        items = items.order_by(m.Courses.order_by)
-    items = items.order_by(type.order_by)
-    numItems = items.count()
-    items = items.limit(limit).offset(offset).all()
-
-    maxPage = ((numItems - 1) // limit) + 1
-    if maxPage < 1:
-        maxPage = 1
+    numItems = cached_count(items, type.__tablename__)
+    items, prev, next = paginate(
+        items,
+        type.page_keys,
+        app.settings.page_length,
+        request.args.get('page'))
 
     args = dict(request.args)
     if 'page' in args:
         args.pop('page')
+    args['type'] = type
 
     html = render_template(
         'list_admin.html',
@@ -1017,10 +2013,8 @@ def list_admin(type):
         type=type,
         items=items,
         numItems=numItems,
-        limit=limit,
-        page=page,
-        offset=offset,
-        maxPage=maxPage,
+        prev=prev,
+        next=next,
         args=args,
     )
     return html
@@ -1136,7 +2130,12 @@ def save_edit_admin(type):
         else:
             obj = type(**form)
             db.session.add(obj)
+        if type == m.Messages:
+            # rendered once here instead of on every status board request
+            obj.html = markdown(obj.message or '')
     db.session.commit()
+    status_changed()
+    reference_cache.invalidate()
 
     html = redirect(url_for('list_admin', type=type))
     return html
@@ -1151,23 +2150,13 @@ def list_tutors():
     if not user or not user.is_superuser:
         return abort(403)
 
-    limit = app.config['PAGE_LENGTH']
-    page = get_int(request.args.get('page'))
-    if page is None:
-        page = 1
-    offset = (page - 1) * limit
-
-    items = m.Tutors.query.\
-        order_by(m.Tutors.is_active.desc()).\
-        order_by(m.Tutors.is_working.desc()).\
-        order_by(m.Tutors.is_superuser.desc()).\
-        order_by(m.Tutors.last_first)
-    numItems = items.count()
-    items = items.limit(limit).offset(offset).all()
-
-    maxPage = ((numItems - 1) // limit) + 1
-    if maxPage < 1:
-        maxPage = 1
+    items = m.Tutors.query
+    numItems = cached_count(items, 'tutors')
+    items, prev, next = paginate(
+        items,
+        m.Tutors.page_keys,
+        app.settings.page_length,
+        request.args.get('page'))
 
     args = dict(request.args)
     if 'page' in args:
@@ -1177,17 +2166,81 @@ def list_tutors():
         'list_tutors.html',
         user=user,
         header="Tutors",
+        courses=get_courses(),
         items=items,
         numItems=numItems,
-        limit=limit,
-        page=page,
-        offset=offset,
-        maxPage=maxPage,
+        prev=prev,
+        next=next,
         args=args,
     )
     return html
 
 
+def set_tutor_courses(tutor_id, courses, shown):
+    r"""
+    Makes courses the set of course ids a tutor can tutor
+        among the course ids shown on the form
+    Courses that were not shown are left as they are
+    Only the differences are written, with one INSERT and one DELETE
+    """
+    table = m.can_tutor_table
+    current = {
+        course_id for course_id, in db.session.execute(
+            sqlalchemy.select([table.c.course_id]).
+            where(table.c.tutor_id == tutor_id))
+    }
+
+    added = courses - current
+    if added:
+        db.session.execute(table.insert(), [
+            {'tutor_id': tutor_id, 'course_id': course_id}
+            for course_id in added
+        ])
+    removed = (current & shown) - courses
+    if removed:
+        db.session.execute(
+            table.delete().
+            where(table.c.tutor_id == tutor_id).
+            where(table.c.course_id.in_(removed)))
+
+
+@app.route('/admin/tutors/assign', methods=['POST'])
+def assign_tutors():
+    r"""
+    Allows many tutors to tutor a course at once
+    """
+    user = get_user()
+    if not user or not user.is_superuser:
+        return abort(403)
+
+    course_id = get_int(request.form.get('course_id'))
+    tutors = {get_int(id) for id in request.form.getlist('tutor_id')}
+    tutors.discard(None)
+
+    if course_id is not None and tutors:
+        table = m.can_tutor_table
+        current = {
+            tutor_id for tutor_id, in db.session.execute(
+                sqlalchemy.select([table.c.tutor_id]).
+                where(table.c.course_id == course_id).
+                where(table.c.tutor_id.in_(tutors)))
+        }
+        added = tutors - current
+        if added:
+            db.session.execute(table.insert(), [
+                {'tutor_id': tutor_id, 'course_id': course_id}
+                for tutor_id in added
+            ])
+        db.session.commit()
+        status_changed()
+        reference_cache.invalidate()
+        user_cache.clear()
+        flash('&#10004; Course assigned to {} more tutor{}'.format(
+            len(added), '' if len(added) == 1 else 's'))
+
+    return redirect(request.referrer or url_for('list_tutors'))
+
+
 @app.route('/admin/tutors/new')
 @app.route('/admin/tutors/<int:id>')
 def edit_tutors(id=None):
@@ -1203,9 +2256,7 @@ def edit_tutors(id=None):
     else:
         tutor = m.Tutors.query.filter_by(id=id).one()
 
-    courses = m.Courses.query.\
-        order_by(m.Courses.order_by).\
-        filter(m.Courses.on_display == True).all()
+    courses = get_courses(displayed=True)
 
     html = render_template(
         'edit_tutors.html',
@@ -1227,8 +2278,10 @@ def save_edit_tutors():
     if not user or not (user.is_superuser or user.id == id):
         return abort(403)
 
+    emails = set()
     if request.form.get('action') == 'delete':
-        obj = type.query.filter_by(id=id).one()
+        obj = m.Tutors.query.filter_by(id=id).one()
+        emails.add(obj.email)
         db.session.delete(obj)
     else:
         form = {
@@ -1247,22 +2300,29 @@ def save_edit_tutors():
 
         if id is not None:
             obj = m.Tutors.query.filter_by(id=id).one()
+            emails.add(obj.email)
             for key, value in form.items():
                 if getattr(obj, key) != value:
                     setattr(obj, key, value)
         else:
             obj = m.Tutors(**form)
             db.session.add(obj)
-
-        for course in m.Courses.query.all():
-            if request.form.get(course.number):
-                if course not in obj.courses:
-                    obj.courses.append(course)
-            else:
-                if course in obj.courses:
-                    obj.courses.remove(course)
+            db.session.flush()
+        emails.add(obj.email)
+
+        # the form only shows the displayed courses
+        shown = get_courses(displayed=True)
+        courses = {
+            course.id for course in shown
+            if request.form.get(course.number)
+        }
+        set_tutor_courses(obj.id, courses, {course.id for course in shown})
 
     db.session.commit()
+    status_changed()
+    reference_cache.invalidate()
+    for email in emails:
+        user_cache.pop(email)
 
     if user.is_superuser:
         html = redirect(url_for('list_tutors'))
@@ -1272,7 +2332,6 @@ def save_edit_tutors():
 
 
 # ----#-   Login/Logout
-@google.tokengetter
 def get_google_token(token=None):
     r"""
     Returns a user's token from OAuth
@@ -1280,6 +2339,29 @@ def get_google_token(token=None):
     return session.get('google_token')
 
 
+def get_google():
+    r"""
+    Gets the Google OAuth client
+    flask_oauthlib and oauthlib are only imported when a tutor logs in
+    """
+    global google
+    if google is None:
+        from flask_oauthlib.client import OAuth
+        remote = OAuth().remote_app(
+            'google',
+            app_key='GOOGLE',
+            request_token_params={'scope': 'email'},
+            base_url='https://www.googleapis.com/oauth2/v1/',
+            request_token_url=None,
+            access_token_method='POST',
+            access_token_url='https://accounts.google.com/o/oauth2/token',
+            authorize_url='https://accounts.google.com/o/oauth2/auth',
+        )
+        remote.tokengetter(get_google_token)
+        google = remote
+    return google
+
+
 @app.route('/login/')
 def login():
     r"""
@@ -1296,7 +2378,7 @@ def login():
             session.get('username')))
         html = redirect(next or url_for('index'))
     else:
-        html = google.authorize(
+        html = get_google().authorize(
             callback=url_for('oauth_authorized', _external=True),
             state=next,
         )
@@ -1310,19 +2392,24 @@ def oauth_authorized():
     """
     next_url = request.args.get('state') or url_for('index')
 
-    resp = google.authorized_response()
+    resp = get_google().authorized_response()
     if resp is None:
         return redirect(next_url)
 
     session['google_token'] = (resp['access_token'], '')
 
-    https = requests.get(
-        'https://www.googleapis.com/plus/v1/people/me',
-        params={
-            'access_token': session['google_token'][0],
-            'fields': 'emails',
-        },
-    )
+    try:
+        https = google_api.get(
+            'https://www.googleapis.com/plus/v1/people/me',
+            params={
+                'access_token': session['google_token'][0],
+                'fields': 'emails',
+            },
+        )
+    except UpstreamError:
+        session.clear()
+        flash('&#10006; Could not reach Google to log in, please try again.')
+        return redirect(next_url)
     userinfo = https.json()
 
     for email in userinfo.get('emails', []):
@@ -1352,7 +2439,3 @@ def logout():
         'You will need to log out of Google separately.')
     return redirect(url_for('index'))
 # ----#-   End App
-
-
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
-    'DATABASE_URL', 'sqlite:///:memory:')
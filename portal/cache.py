@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+
+from jinja2 import FileSystemBytecodeCache
+
+
+class SnapshotCache:
+    r"""
+    Stores computed values until the data they were computed from changes
+    Calling invalidate() after a write discards every stored snapshot
+    Snapshots older than max_age seconds are also recomputed,
+        so that writes made by other workers are picked up eventually
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._snapshots = {}
+
+    def get(self, key, compute):
+        r"""
+        Returns the snapshot stored for key
+        Calls compute() to create the snapshot if it is missing or stale
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                version, created, value = snapshot
+                fresh = self.max_age is None or \
+                    time.monotonic() - created < self.max_age
+                if version == self.version and fresh:
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            version = self.version
+
+        value = compute()
+
+        with self._lock:
+            # a write during compute() means value may already be stale
+            if version == self.version:
+                self._snapshots[key] = (version, time.monotonic(), value)
+        return value
+
+    def invalidate(self):
+        r"""
+        Discards all snapshots
+        Should be called after committing a change to the cached data
+        """
+        with self._lock:
+            self.version += 1
+            self.invalidations += 1
+            self._snapshots.clear()
+
+    def stats(self):
+        r"""
+        Returns the cache counters for monitoring
+        """
+        with self._lock:
+            return {
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._snapshots),
+            }
+
+
+class TTLCache:
+    r"""
+    Stores values by key for at most ttl seconds
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def get(self, key):
+        r"""
+        Returns the value stored for key, or None if missing or expired
+        """
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is not None:
+                expires, value = entry
+                if time.monotonic() < expires:
+                    self.hits += 1
+                    return value
+                del self._values[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        r"""
+        Stores value for key
+        """
+        with self._lock:
+            self._values[key] = (time.monotonic() + self.ttl, value)
+
+    def pop(self, key):
+        r"""
+        Discards the value stored for key
+        """
+        with self._lock:
+            self._values.pop(key, None)
+
+    def clear(self):
+        r"""
+        Discards all values
+        """
+        with self._lock:
+            self._values.clear()
+
+    def stats(self):
+        r"""
+        Returns the cache counters for monitoring
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._values),
+            }
+
+
+class TemplateCache (FileSystemBytecodeCache):
+    r"""
+    Stores compiled Jinja templates on disk, shared by all workers
+    Keyed by template name only, so a cache built at deploy time
+        in another directory is still used at run time
+    Jinja checks the source checksum, so edited templates are recompiled
+    """
+
+    def __init__(self, directory):
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            # read only location, load_bytecode and dump_bytecode
+            # then find nothing and templates are compiled in memory
+            pass
+        super().__init__(directory)
+
+    def load_bytecode(self, bucket):
+        try:
+            super().load_bytecode(bucket)
+        except OSError:
+            pass
+
+    def get_cache_key(self, name, filename=None):
+        return super().get_cache_key(name)
+
+    def dump_bytecode(self, bucket):
+        try:
+            super().dump_bytecode(bucket)
+        except OSError:
+            # a read only cache still works, templates are compiled in memory
+            pass
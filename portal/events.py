@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import collections
+import json
+import os
+import threading
+import time
+
+
+class Broadcaster:
+    r"""
+    Fans out events to every Server-Sent Events stream of a worker
+
+    Keeps the latest value of each event for listeners that just connected,
+    and a short backlog of changes for listeners that reconnect
+    Every message is a JSON object: {"full": bool, "data": ...}
+    """
+
+    def __init__(self, backlog=64, keepalive=15, lifetime=10 * 60):
+        self.keepalive = keepalive
+        self.lifetime = lifetime
+        self.last_id = 0
+        self.listeners = 0
+        # distinguishes event ids of this worker from those of other workers
+        self.token = os.urandom(4).hex()
+        self._condition = threading.Condition()
+        self._events = collections.deque(maxlen=backlog)
+        self._state = {}
+
+    def publish(self, event, data, diff=None):
+        r"""
+        Sends data to all listeners if it differs from the last published
+        diff(old, new) may return the changed part of data to send instead,
+            or None to send all of it
+        """
+        with self._condition:
+            old = self._state.get(event)
+            if old == data:
+                return
+            delta = None
+            if old is not None and diff is not None:
+                delta = diff(old, data)
+            if delta is None:
+                message = {'full': True, 'data': data}
+            else:
+                message = {'full': False, 'data': delta}
+
+            self.last_id += 1
+            self._state[event] = data
+            self._events.append((self.last_id, event, message))
+            self._condition.notify_all()
+
+    def parse_id(self, event_id):
+        r"""
+        Converts a Last-Event-ID header into an event number
+        Returns None for ids that were not sent by this broadcaster
+        """
+        token, _, number = (event_id or '').partition('-')
+        if token != self.token or not number.isdigit():
+            return None
+        return int(number)
+
+    def _since(self, last_id):
+        r"""
+        Gets the messages a listener that has seen last_id is missing
+        Falls back to the full state if the backlog no longer covers it
+        """
+        if last_id == self.last_id:
+            return []
+        if last_id is None or last_id > self.last_id or \
+                not self._events or self._events[0][0] > last_id + 1:
+            return [
+                (self.last_id, event, {'full': True, 'data': data})
+                for event, data in self._state.items()
+            ]
+        return [e for e in self._events if e[0] > last_id]
+
+    def listen(self, last_id=None):
+        r"""
+        Generates the text of a Server-Sent Events stream
+        Ends after lifetime seconds, browsers reconnect automatically
+        """
+        with self._condition:
+            self.listeners += 1
+        try:
+            yield 'retry: 5000\n\n'
+            deadline = time.monotonic() + self.lifetime
+            while time.monotonic() < deadline:
+                with self._condition:
+                    messages = self._since(last_id)
+                    if not messages:
+                        self._condition.wait(self.keepalive)
+                        messages = self._since(last_id)
+
+                if not messages:
+                    yield ': keepalive\n\n'
+                for id, event, message in messages:
+                    last_id = id
+                    yield 'id: {}-{}\nevent: {}\ndata: {}\n\n'.format(
+                        self.token, id, event, json.dumps(message))
+        finally:
+            with self._condition:
+                self.listeners -= 1
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+
+class _Batch:
+    r"""
+    Rows waiting to be written together
+    """
+
+    def __init__(self):
+        self.rows = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        # the error each row failed with, None for written rows
+        self.errors = []
+
+
+class GroupCommit:
+    r"""
+    Collects rows from concurrent requests and writes them in batches
+    The first caller of a batch waits at most max_wait seconds for others
+        to join it, then writes the whole batch with one call to write(rows)
+    If the batch fails its rows are written one at a time,
+        so a bad row only fails the caller that submitted it
+    Every caller returns once its row is written,
+        or raises the error that prevented its row from being written
+    A max_wait of 0 disables batching, every row is written on its own
+    """
+
+    def __init__(self, write, max_batch=50, max_wait=0):
+        self.write = write
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batches = 0
+        self.rows = 0
+        self.largest = 0
+        self.retried = 0
+        self._lock = threading.Lock()
+        self._batch = None
+
+    def submit(self, row):
+        r"""
+        Adds row to the current batch and waits until it is written
+        """
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = _Batch()
+                if self.max_wait and self.max_batch > 1:
+                    self._batch = batch
+            index = len(batch.rows)
+            batch.rows.append(row)
+            if len(batch.rows) >= self.max_batch:
+                # later rows start a new batch
+                if self._batch is batch:
+                    self._batch = None
+                batch.full.set()
+
+        if not leader:
+            batch.done.wait()
+            if batch.errors[index] is not None:
+                raise batch.errors[index]
+            return
+
+        batch.full.wait(self.max_wait)
+        with self._lock:
+            if self._batch is batch:
+                self._batch = None
+            self.batches += 1
+            self.rows += len(batch.rows)
+            self.largest = max(self.largest, len(batch.rows))
+
+        try:
+            batch.errors = self._write(batch.rows)
+        finally:
+            if len(batch.errors) != len(batch.rows):
+                # _write itself failed, nothing is known to be written
+                batch.errors = [RuntimeError('batch was not written')] * \
+                    len(batch.rows)
+            batch.done.set()
+        if batch.errors[index] is not None:
+            raise batch.errors[index]
+
+    def _write(self, rows):
+        r"""
+        Writes rows, one at a time if writing them together fails
+        Returns the error of each row, None for the rows written
+        """
+        try:
+            self.write(rows)
+            return [None] * len(rows)
+        except Exception as e:
+            if len(rows) == 1:
+                return [e]
+
+        with self._lock:
+            self.retried += 1
+        errors = []
+        for row in rows:
+            try:
+                self.write([row])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    def stats(self):
+        r"""
+        Returns the batching counters for monitoring
+        """
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'rows': self.rows,
+                'largest': self.largest,
+                'retried': self.retried,
+            }
+
+
+class Deduplicator:
+    r"""
+    Recognises repeated submissions of the same key within window seconds
+    """
+
+    def __init__(self, window=60):
+        self.window = window
+        self.unique = 0
+        self.collapsed = 0
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def seen(self, key):
+        r"""
+        Returns whether key was already submitted within the window
+        Otherwise records it as submitted now
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._seen.get(key, -self.window) < self.window:
+                self.collapsed += 1
+                return True
+            if len(self._seen) > 1000:
+                self._seen = {
+                    k: t for k, t in self._seen.items()
+                    if now - t < self.window
+                }
+            self._seen[key] = now
+            self.unique += 1
+            return False
+
+    def forget(self, key):
+        r"""
+        Allows key to be submitted again, for submissions that failed
+        """
+        with self._lock:
+            self._seen.pop(key, None)
+
+    def stats(self):
+        r"""
+        Returns the duplicate counters for monitoring
+        """
+        with self._lock:
+            return {
+                'unique': self.unique,
+                'collapsed': self.collapsed,
+            }
+
+
+class RateLimiter:
+    r"""
+    Token bucket admission control per client
+    Each client may make burst calls at once,
+        after which it gains one call every 60 / rate seconds
+    """
+
+    def __init__(self, rate=6, burst=3):
+        self.rate = rate
+        self.burst = burst
+        self.allowed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def allow(self, client):
+        r"""
+        Takes a token from the bucket of client
+        Returns False if the bucket is empty and the call should be dropped
+        """
+        now = time.monotonic()
+        refill = self.rate / 60
+        with self._lock:
+            tokens, last = self._buckets.get(client, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * refill)
+            if tokens < 1:
+                self._buckets[client] = (tokens, now)
+                self.dropped += 1
+                return False
+            if len(self._buckets) > 1000:
+                # full buckets are the same as missing ones
+                self._buckets = {
+                    c: (t, at) for c, (t, at) in self._buckets.items()
+                    if t + (now - at) * refill < self.burst
+                }
+            self._buckets[client] = (tokens - 1, now)
+            self.allowed += 1
+            return True
+
+    def stats(self):
+        r"""
+        Returns the admission counters for monitoring
+        """
+        with self._lock:
+            return {
+                'allowed': self.allowed,
+                'dropped': self.dropped,
+                'clients': len(self._buckets),
+            }
@@ -12,10 +12,10 @@ from sqlalchemy import (
     Enum,
     ForeignKey,
 )
-from sqlalchemy.schema import Table
+from sqlalchemy.schema import Table, Index
 from sqlalchemy.orm import relationship, column_property
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql.expression import cast
+from sqlalchemy.sql.expression import cast, literal_column
 
 EMAIL = String(256)
 
@@ -52,6 +52,8 @@ can_tutor_table = Table(
         ForeignKey('courses.course_id', onupdate=onupdate, ondelete=cascade),
         primary_key=True,
         doc='The course that a tutor can tutor'),
+    # the primary key only serves lookups by tutor
+    Index('ix_can_tutor_course_id', 'course_id'),
 )
 
 
@@ -83,6 +85,9 @@ class Messages (Base):
     message = Column(
         'message_text', String,
         doc='The text to display on the status screen')
+    html = Column(
+        'message_html', String,
+        doc='The message text rendered as sanitized HTML')
     start_date = Column(
         Date,
         doc='The beginning of when the message should be displayed')
@@ -103,6 +108,21 @@ class Status (enum.Enum):
     Closed = 3
 
 
+# Tickets that are still waiting for or receiving help
+active_statuses = (Status.Open, Status.Claimed)
+
+
+def is_active(status):
+    r"""
+    The condition for open and claimed tickets
+    The statuses are inlined as literals, SQLite only uses a partial index
+        if the query repeats the condition exactly and without parameters
+    """
+    return status.in_([
+        literal_column("'{}'".format(s.name)) for s in active_statuses
+    ])
+
+
 class Tickets (Base):
     r"""
     Tickets requested by students
@@ -188,6 +208,18 @@ class Tickets (Base):
         'ProblemTypes',
         back_populates='tickets')
 
+    __table_args__ = (
+        # reports and the ticket queue, newest first
+        Index('ix_tickets_time_created', time_created, id),
+        Index('ix_tickets_time_closed', time_closed),
+        Index('ix_tickets_section_id', section_id),
+        # open and claimed tickets are a small, constantly queried subset
+        Index(
+            'ix_tickets_active', section_id,
+            postgresql_where=is_active(status),
+            sqlite_where=is_active(status)),
+    )
+
     def dict(self):
         return {
             'id': self.id,
@@ -273,6 +305,10 @@ class Tutors (Base):
     fullname = column_property(fname + " " + lname)
     last_first = column_property(lname + ", " + fname)
 
+    __table_args__ = (
+        Index('ix_tutors_is_working', is_working),
+    )
+
     tickets = relationship(
         'Tickets',
         foreign_keys=[Tickets.tutor_id],
@@ -363,6 +399,11 @@ class Sections (Base):
             onupdate=onupdate, ondelete=ondelete),
         doc='The professor that teaches a section')
 
+    __table_args__ = (
+        Index('ix_sections_course_id', course_id),
+        Index('ix_sections_semester_id', semester_id),
+    )
+
     tickets = relationship(
         'Tickets',
         order_by='Tickets.id',
@@ -470,6 +511,11 @@ class Semesters (Base):
         doc='The last day of the semester')
     title = column_property(cast(year, String) + ' ' + season)
 
+    __table_args__ = (
+        # finding the current semester by date
+        Index('ix_semesters_dates', start_date, end_date),
+    )
+
     sections = relationship(
         'Sections',
         order_by='Sections.number',
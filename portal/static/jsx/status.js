@@ -4,6 +4,8 @@ class Messages extends React.Component {
         this.error = this.error.bind(this)
         this.update = this.update.bind(this)
         this.refresh = this.refresh.bind(this)
+        this.poll = this.poll.bind(this)
+        this.receive = this.receive.bind(this)
         this.state = {}
     }
 
@@ -12,24 +14,35 @@ class Messages extends React.Component {
     }
 
     update() {
-        this.setState({messages: undefined})
+        // ifModified sends If-None-Match with the last ETag,
+        // an unchanged list comes back as an empty 304 "notmodified"
         this.request = $.ajax({
             url: '/api/messages',
             type: 'GET',
             dataType: 'json',
+            ifModified: true,
             error: (jqXHR) => this.error("Failed to load messages", jqXHR),
-            success: (data) => this.setState({messages: data}),
+            success: (data, status) => {
+                if (status !== 'notmodified') {
+                    this.setState({messages: data})
+                }
+            },
         })
     }
 
     refresh(e) {
-        this.componentWillUnmount()
-        this.componentDidMount()
+        this.update()
+    }
+
+    poll() {
+        // fallback for when the event stream is unavailable
+        if (this.interval === undefined) {
+            this.interval = setInterval(this.update, 3 * 60 * 1000)
+        }
     }
 
     componentDidMount() {
         this.update()
-        this.interval = setInterval(this.update, 3 * 60 * 1000)
     }
 
     componentWillUnmount() {
@@ -39,6 +52,10 @@ class Messages extends React.Component {
         }
     }
 
+    receive(message) {
+        this.setState({messages: message.data})
+    }
+
     render() {
         if (this.state.messages !== undefined) {
             return (
@@ -62,6 +79,8 @@ class Courses extends React.Component {
         this.error = this.error.bind(this)
         this.update = this.update.bind(this)
         this.refresh = this.refresh.bind(this)
+        this.poll = this.poll.bind(this)
+        this.receive = this.receive.bind(this)
         this.state = {}
     }
 
@@ -70,24 +89,35 @@ class Courses extends React.Component {
     }
 
     update() {
-        this.setState({courses: undefined})
+        // ifModified sends If-None-Match with the last ETag,
+        // an unchanged list comes back as an empty 304 "notmodified"
         this.request = $.ajax({
             url: '/api/courses',
             type: 'GET',
             dataType: 'json',
+            ifModified: true,
             error: (jqXHR) => this.error("Failed to load courses", jqXHR),
-            success: (data) => this.setState({courses: data}),
+            success: (data, status) => {
+                if (status !== 'notmodified') {
+                    this.setState({courses: data})
+                }
+            },
         })
     }
 
     refresh(e) {
-        this.componentWillUnmount()
-        this.componentDidMount()
+        this.update()
+    }
+
+    poll() {
+        // fallback for when the event stream is unavailable
+        if (this.interval === undefined) {
+            this.interval = setInterval(this.update, 3 * 60 * 1000)
+        }
     }
 
     componentDidMount() {
         this.update()
-        this.interval = setInterval(this.update, 3 * 60 * 1000)
     }
 
     componentWillUnmount() {
@@ -97,6 +127,17 @@ class Courses extends React.Component {
         }
     }
 
+    receive(message) {
+        if (message.full) {
+            this.setState({courses: message.data})
+        }
+        else if (this.state.courses !== undefined) {
+            // partial updates only contain the rows that changed
+            const changed = new Map(message.data.map((item) => [item.name, item]))
+            this.setState({courses: this.state.courses.map((item) => changed.get(item.name) || item)})
+        }
+    }
+
     render() {
         if (this.state.courses !== undefined) {
             return (
@@ -136,6 +177,8 @@ class Status extends React.Component {
         super(props)
         this.error = this.error.bind(this)
         this.refresh = this.refresh.bind(this)
+        this.poll = this.poll.bind(this)
+        this.receive = this.receive.bind(this)
         this.state = {}
     }
 
@@ -143,6 +186,44 @@ class Status extends React.Component {
         this.setState({'error': message})
     }
 
+    receive(name, e) {
+        const component = this[name]
+        if (component) {
+            component.receive(JSON.parse(e.data))
+        }
+    }
+
+    poll() {
+        if (this.messages) {
+            this.messages.poll()
+        }
+        if (this.courses) {
+            this.courses.poll()
+        }
+    }
+
+    componentDidMount() {
+        if (window.EventSource === undefined) {
+            this.poll()
+            return
+        }
+        this.source = new EventSource('/api/stream')
+        this.source.addEventListener('messages', (e) => this.receive('messages', e))
+        this.source.addEventListener('courses', (e) => this.receive('courses', e))
+        this.source.onerror = (e) => {
+            // the browser reconnects by itself unless the stream is unavailable
+            if (this.source.readyState === EventSource.CLOSED) {
+                this.poll()
+            }
+        }
+    }
+
+    componentWillUnmount() {
+        if (this.source !== undefined) {
+            this.source.close()
+        }
+    }
+
     componentDidCatch(error, info) {
         this.error("Unknown error")
     }
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import threading
+import time
+
+
+class UpstreamError (Exception):
+    r"""
+    Raised when an upstream service could not be reached or failed
+    """
+
+
+class CircuitOpen (UpstreamError):
+    r"""
+    Raised instead of calling an upstream service that keeps failing
+    """
+
+
+class CircuitBreaker:
+    r"""
+    Stops calls to an upstream service after repeated failures
+    After reset seconds one trial call is let through,
+        a success closes the circuit again and a failure reopens it
+    """
+
+    def __init__(self, failures=5, reset=30):
+        self.max_failures = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        r"""
+        Returns whether a call may be made now
+        """
+        with self._lock:
+            if self.opened is None:
+                return True
+            if time.monotonic() - self.opened >= self.reset:
+                # half open, let this call through as a trial
+                self.opened = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                self.opened = time.monotonic()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        elif time.monotonic() - self.opened >= self.reset:
+            return 'half-open'
+        return 'open'
+
+
+class Upstream:
+    r"""
+    HTTP client for an upstream service
+    Keeps connections alive in a shared pool, bounds every call with
+        connect and read timeouts, retries failed connections
+        and stops calling the service while it is failing
+    requests is only imported once the first call is made
+    """
+
+    def __init__(
+            self, name,
+            timeout=(3.05, 5), retries=2, pool=10, failures=5, reset=30):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.pool = pool
+        self.breaker = CircuitBreaker(failures=failures, reset=reset)
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._session = None
+
+    @property
+    def session(self):
+        r"""
+        The requests session shared by all calls, created on first use
+        """
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from requests.packages.urllib3.util.retry import Retry
+
+                # only connection errors are retried, the request was never
+                # sent so retrying is safe even for POSTs like reCAPTCHA
+                retry = Retry(
+                    total=self.retries, connect=self.retries,
+                    read=0, redirect=0, status=0, backoff_factor=0.1)
+                adapter = HTTPAdapter(
+                    pool_maxsize=self.pool, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def request(self, method, url, **kwargs):
+        r"""
+        Makes a request, raising an UpstreamError on failure
+        Raises CircuitOpen without calling the service while it is failing
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpen('{} is unavailable'.format(self.name))
+
+        session = self.session
+        from requests import RequestException
+
+        self.calls += 1
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            response = session.request(method, url, **kwargs)
+            response.raise_for_status()
+        except RequestException as e:
+            self.errors += 1
+            self.breaker.failure()
+            raise UpstreamError(
+                '{} request failed: {}'.format(self.name, e)) from e
+        self.breaker.success()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        r"""
+        Returns the client counters for monitoring
+        """
+        return {
+            'state': self.breaker.state,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rejected': self.rejected,
+        }
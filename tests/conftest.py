@@ -0,0 +1,34 @@
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope='session')
+def model():
+    r"""
+    The portal.model module, loaded on its own
+    Schema tests then only need SQLAlchemy, not the whole Flask stack
+    """
+    spec = importlib.util.spec_from_file_location(
+        'portal_model', os.path.join(ROOT, 'portal', 'model.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def portal():
+    r"""
+    The portal app, set up on an in-memory SQLite database
+    Skips the test if the app's dependencies cannot be imported
+    """
+    os.environ['DATABASE_URL'] = 'sqlite://'
+    try:
+        import portal
+    except ImportError as e:
+        pytest.skip('cannot import portal: {}'.format(e))
+    portal.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://'})
+    return portal
@@ -0,0 +1,66 @@
+import datetime
+
+from sqlalchemy import event
+
+
+def plans(portal, run):
+    r"""
+    Calls run and gets the query plan of every statement it sent
+    The plans are one lowercase string per statement, explained with
+        the statement and parameters exactly as the app sent them
+    """
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, many):
+        statements.append((statement, parameters))
+
+    engine = portal.db.engine
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        run()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+
+    cursor = portal.db.session.connection().connection.cursor()
+    explained = []
+    for statement, parameters in statements:
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        explained.append(' '.join(row[-1] for row in cursor).lower())
+    return explained
+
+
+def hot_queries(portal):
+    r"""
+    The hot pages of the app, built by the app's own query code,
+        and the indexes their queries should use
+    """
+    m = portal.m
+    today = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def report(args):
+        return lambda: portal.paginate(
+            portal.filter_report(args), m.Tickets.page_keys, 10, None)
+
+    return [
+        ('status board', portal.course_availability,
+            ['ix_tickets_active', 'ix_tutors_is_working']),
+        ('reports', report({}), ['ix_tickets_time_created']),
+        ('reports by semester', report({'semester': '1'}),
+            ['ix_sections_semester_id', 'ix_tickets_section_id']),
+        ('reports by course', report({'course': '1'}),
+            ['ix_sections_course_id', 'ix_tickets_section_id']),
+        ('open and claimed tickets',
+            lambda: portal.ticket_queues(today)[0].all(),
+            ['ix_tickets_active']),
+        ('tickets closed today',
+            lambda: portal.ticket_queues(today)[1].all(),
+            ['ix_tickets_time_closed']),
+    ]
+
+
+def test_sqlite_indexes(portal):
+    with portal.app.app_context():
+        for name, run, indexes in hot_queries(portal):
+            explained = ' '.join(plans(portal, run))
+            for index in indexes:
+                assert index in explained, (name, index, explained)
@@ -0,0 +1,14 @@
+def test_reference_load_keeps_request_flush(portal):
+    m = portal.m
+    session = portal.db.session
+    with portal.app.app_context():
+        portal.reference_cache.invalidate()
+        session.add(m.Tutors(email='new.tutor@unomaha.edu'))
+        session.flush()
+        # a cache miss in the middle of the request, as in save_edit_tutors
+        portal.get_courses()
+        session.commit()
+        session.remove()
+
+        assert m.Tutors.query.filter_by(
+            email='new.tutor@unomaha.edu').count() == 1
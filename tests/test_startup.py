@@ -0,0 +1,52 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+# modules that must only be imported once they are first used
+LAZY_MODULES = ['bleach', 'markdown2', 'requests', 'flask_oauthlib']
+# cumulative import time of portal, in milliseconds
+IMPORT_BUDGET_MS = int(os.environ.get('PORTAL_IMPORT_BUDGET_MS', '1500'))
+
+
+def import_portal():
+    r"""
+    Imports portal in a fresh interpreter with -X importtime
+    Returns the loaded lazy modules and the import times by module in ms
+    """
+    code = (
+        'import sys, json, portal; '
+        'print(json.dumps([m for m in {!r} if m in sys.modules]))'
+    ).format(LAZY_MODULES)
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=dict(os.environ, DATABASE_URL='sqlite://'))
+    if process.returncode != 0:
+        pytest.skip('cannot import portal: {}'.format(
+            process.stderr.strip().splitlines()[-1]))
+
+    times = {}
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, name = line.split('|')
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1000
+    return json.loads(process.stdout.strip().splitlines()[-1]), times
+
+
+def test_lazy_imports():
+    loaded, _ = import_portal()
+    assert loaded == []
+
+
+def test_import_budget():
+    _, times = import_portal()
+    slowest = sorted(times.items(), key=lambda t: -t[1])[:10]
+    assert times['portal'] <= IMPORT_BUDGET_MS, slowest
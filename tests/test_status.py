@@ -0,0 +1,61 @@
+import datetime
+
+from sqlalchemy import event
+
+
+def add_courses(portal, count):
+    r"""
+    Adds count displayed courses, each with a section, a ticket and a tutor
+    """
+    m = portal.m
+    session = portal.db.session
+    semester = m.Semesters(
+        year=2018, season=m.Seasons.Fall,
+        start_date=datetime.date(2018, 8, 1),
+        end_date=datetime.date(2018, 12, 31))
+    professor = m.Professors(fname='Ada', lname='Lovelace')
+    start = session.query(m.Courses).count()
+    for number in range(start, start + count):
+        course = m.Courses(number='CSCI {}'.format(number), on_display=True)
+        section = m.Sections(
+            number=1, course=course, semester=semester, professor=professor)
+        session.add(m.Tickets(
+            student_email='student{}@unomaha.edu'.format(number),
+            section=section,
+            status=m.Status.Open,
+            time_created=portal.now()))
+        session.add(m.Tutors(
+            email='tutor{}@unomaha.edu'.format(number),
+            is_active=True, is_working=True, courses=[course]))
+    session.commit()
+
+
+def count_queries(portal, function):
+    r"""
+    Counts the statements function sends to the database
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    engine = portal.db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        function()
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    return len(statements)
+
+
+def test_course_availability_queries(portal):
+    with portal.app.app_context():
+        add_courses(portal, 10)
+        few = count_queries(portal, portal.course_availability)
+        add_courses(portal, 10)
+        many = count_queries(portal, portal.course_availability)
+        courses = portal.course_availability()
+
+    assert few == many
+    assert courses[-1] == {
+        'name': 'Total', 'current_tickets': 20, 'current_tutors': 20}